@@ -1,11 +1,20 @@
 """Shelly Services - Authentication control for Shelly devices."""
 from __future__ import annotations
 
+import asyncio
 import logging
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+
+from .helpers import (
+    MAX_CONCURRENT_REQUESTS,
+    basic_auth,
+    discover_shelly_devices,
+    prewarm_gens,
+)
 
 DOMAIN = "shelly_services"
 PLATFORMS = [
@@ -20,9 +29,33 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Shelly Services."""
     _LOGGER.info("Setting up Shelly Services v0.0.1")
     
-    # Store config
+    # Store config and discovered Shelly devices (shared by all platforms)
+    devices = discover_shelly_devices(hass)
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][entry.entry_id] = entry.data
+    entry_data = {
+        "credentials": entry.data,
+        "auth": basic_auth(
+            entry.data.get("username", "admin"),
+            entry.data.get("password", ""),
+        ),
+        "devices": devices,
+        # Request state, created per entry so it is bound to the running loop
+        "session": async_get_clientsession(hass),
+        "semaphore": asyncio.Semaphore(MAX_CONCURRENT_REQUESTS),
+        "gen_pending": {},
+    }
+    hass.data[DOMAIN][entry.entry_id] = entry_data
+    
+    # Probe generations the Shelly integration doesn't know in the
+    # background, so the platforms find them cached
+    hosts = [
+        host for host, device_info in devices.items() if device_info["gen"] is None
+    ]
+    if hosts:
+        hass.async_create_background_task(
+            prewarm_gens(hass, entry_data, hosts),
+            "shelly_services_gen_prewarm",
+        )
     
     # Setup switch platform
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
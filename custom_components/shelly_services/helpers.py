@@ -0,0 +1,212 @@
+"""Shared helpers for Shelly Services."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+import aiohttp
+from aioshelly.exceptions import ShellyError
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import device_registry as dr
+
+_LOGGER = logging.getLogger(__name__)
+
+# Request timeouts (shared, not rebuilt per request)
+TIMEOUT_SHORT = aiohttp.ClientTimeout(total=3)
+TIMEOUT_DEFAULT = aiohttp.ClientTimeout(total=5)
+TIMEOUT_LONG = aiohttp.ClientTimeout(total=10)
+
+# Bound concurrent device requests (e.g. during sensor setup fan-out)
+MAX_CONCURRENT_REQUESTS = 8
+
+# Device generation is effectively immutable, so cache it for a long time.
+# Failed lookups are cached briefly so an offline device is not probed on
+# every toggle/refresh.
+GEN_CACHE_TTL = 3600
+GEN_CACHE_NEGATIVE_TTL = 10
+
+# host -> (gen, expires_at)
+_GEN_CACHE: dict[str, tuple[int, float]] = {}
+
+
+async def request_json(
+    entry_data: dict,
+    url: str,
+    *,
+    method: str = "GET",
+    auth: aiohttp.BasicAuth | None = None,
+    timeout: aiohttp.ClientTimeout = TIMEOUT_DEFAULT,
+    params: dict | None = None,
+    json: Any = None,
+    read_body: bool = True,
+) -> tuple[int, Any]:
+    """Send a request to a device and return (status, JSON body).
+    
+    Uses the entry's shared session (keep-alive connections), with
+    concurrent requests bounded by the entry's semaphore. The body is only
+    read for HTTP 200 when read_body is set, otherwise it is None.
+    """
+    async with entry_data["semaphore"]:
+        async with entry_data["session"].request(
+            method,
+            url,
+            auth=auth,
+            timeout=timeout,
+            params=params,
+            json=json,
+        ) as resp:
+            if resp.status != 200 or not read_body:
+                return resp.status, None
+            return resp.status, await resp.json()
+
+
+def basic_auth(username: str, password: str) -> aiohttp.BasicAuth | None:
+    """Return a BasicAuth for the credentials, or None if incomplete."""
+    if password and username:
+        return aiohttp.BasicAuth(login=username, password=password)
+    return None
+
+
+async def get_gen(
+    hass: HomeAssistant,
+    entry_data: dict,
+    host: str,
+    *,
+    known: int | None = None,
+) -> int:
+    """Return the device generation for host, using a per-host cache.
+    
+    A generation already known from the Shelly integration is returned as is,
+    the device is only probed when it is unknown.
+    """
+    if known is not None:
+        return known
+    
+    cached = _GEN_CACHE.get(host)
+    if cached is not None and time.monotonic() < cached[1]:
+        return cached[0]
+    
+    # Share an in-flight probe (e.g. the setup prewarm) between callers. The
+    # probe is owned by hass, so it is cancelled on shutdown even when no
+    # caller is left waiting for it.
+    gen_pending = entry_data["gen_pending"]
+    pending = gen_pending.get(host)
+    if pending is None:
+        pending = hass.async_create_background_task(
+            _fetch_gen(entry_data, host), f"shelly_services_gen_{host}"
+        )
+        gen_pending[host] = pending
+        pending.add_done_callback(lambda _: gen_pending.pop(host, None))
+    
+    return await asyncio.shield(pending)
+
+
+async def _fetch_gen(entry_data: dict, host: str) -> int:
+    """Probe /shelly for the device generation and cache the result."""
+    now = time.monotonic()
+    
+    try:
+        _, data = await request_json(
+            entry_data, f"http://{host}/shelly", timeout=TIMEOUT_SHORT
+        )
+        if isinstance(data, dict):
+            gen = data.get("gen", 1)
+            if isinstance(gen, int):
+                _GEN_CACHE[host] = (gen, now + GEN_CACHE_TTL)
+                return gen
+            _LOGGER.debug("Invalid generation for %s: %s", host, gen)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as err:
+        _LOGGER.debug("Could not detect generation for %s: %s", host, err)
+    
+    # Assume Gen1 on error
+    _GEN_CACHE[host] = (1, now + GEN_CACHE_NEGATIVE_TTL)
+    return 1
+
+
+async def prewarm_gens(
+    hass: HomeAssistant, entry_data: dict, hosts: list[str]
+) -> None:
+    """Populate the generation cache for hosts concurrently."""
+    await asyncio.gather(
+        *(get_gen(hass, entry_data, host) for host in hosts),
+        return_exceptions=True,
+    )
+
+
+def discover_shelly_devices(hass: HomeAssistant) -> dict[str, dict]:
+    """Find all unique Shelly devices (by IP) in the device registry."""
+    device_registry = dr.async_get(hass)
+    
+    # Index Shelly config entries once instead of looking up every entry
+    shelly_entries = {
+        config_entry.entry_id: config_entry
+        for config_entry in hass.config_entries.async_entries("shelly")
+    }
+    shelly_data = hass.data.get("shelly", {})
+    
+    shelly_devices = {}
+    skipped_count = 0
+    debug = _LOGGER.isEnabledFor(logging.DEBUG)
+    
+    for device in device_registry.devices.values():
+        # Skip devices without identifiers
+        if not device.identifiers:
+            skipped_count += 1
+            if debug:
+                _LOGGER.debug(
+                    "Skipping device '%s' (no identifiers)",
+                    device.name or "Unknown",
+                )
+            continue
+        
+        entry_id = next(
+            (eid for eid in device.config_entries if eid in shelly_entries),
+            None,
+        )
+        if entry_id is None:
+            continue
+        
+        config_entry = shelly_entries[entry_id]
+        host = config_entry.data.get("host")
+        if not host:
+            if debug:
+                _LOGGER.debug(
+                    "Skipping Shelly device '%s' (no host in config)",
+                    device.name or "Unknown",
+                )
+            continue
+        if host not in shelly_devices:
+            # Try to get coordinator from Shelly integration
+            coordinator = None
+            if entry_id in shelly_data:
+                coordinator = shelly_data[entry_id].get("coordinator")
+            
+            # Generation as known by the Shelly integration (None if unknown)
+            gen = config_entry.data.get("gen")
+            if gen is None and coordinator is not None:
+                try:
+                    gen = coordinator.device.gen
+                except (AttributeError, ShellyError):
+                    # Device not initialized yet (offline or asleep)
+                    gen = None
+            
+            shelly_devices[host] = {
+                "device": device,
+                "host": host,
+                "entry": config_entry,
+                "coordinator": coordinator,
+                "gen": gen,
+                # Shared by all entities of this device
+                "attr_device_info": {"identifiers": device.identifiers},
+            }
+    
+    _LOGGER.info(
+        "Found %d unique Shelly devices (skipped %d without identifiers)",
+        len(shelly_devices),
+        skipped_count,
+    )
+    
+    return shelly_devices
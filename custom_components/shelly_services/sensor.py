@@ -1,16 +1,19 @@
 """Sensor platform for Shelly Services."""
 from __future__ import annotations
 
+import asyncio
 import logging
 
-import aiohttp
+from aioshelly.exceptions import ShellyError
 
 from homeassistant.components.sensor import SensorEntity
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
-from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers import entity_registry as er
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
+from .helpers import TIMEOUT_DEFAULT, basic_auth, get_gen, request_json
+
 _LOGGER = logging.getLogger(__name__)
 
 DOMAIN = "shelly_services"
@@ -23,73 +26,61 @@ async def async_setup_entry(
 ) -> None:
     """Set up sensors for all Shelly devices."""
     
-    device_registry = dr.async_get(hass)
-    
-    # Find all unique Shelly devices
-    shelly_devices = {}
+    entry_data = hass.data[DOMAIN][entry.entry_id]
+    shelly_devices = entry_data["devices"]
     
-    for device in device_registry.devices.values():
-        if not device.identifiers:
-            continue
-        
-        for entry_id in device.config_entries:
-            config_entry = hass.config_entries.async_get_entry(entry_id)
-            if config_entry and config_entry.domain == "shelly":
-                host = config_entry.data.get("host")
-                if host and host not in shelly_devices:
-                    shelly_devices[host] = {
-                        "device": device,
-                        "host": host,
-                        "entry": config_entry,
-                    }
-                break
+    entity_registry = er.async_get(hass)
     
     # Create sensors for each device
     entities = []
     for device_info in shelly_devices.values():
-        entities.append(ShellyIPSensor(hass, device_info))
-        entities.append(ShellyConnectivitySensor(hass, device_info))
+        entities.append(ShellyConnectivitySensor(hass, device_info, entry_data))
+        
+        # Remove the former IP Address sensor (now an attribute)
+        entity_id = entity_registry.async_get_entity_id(
+            "sensor", DOMAIN, f"{device_info['device'].id}_ip_address"
+        )
+        if entity_id:
+            entity_registry.async_remove(entity_id)
     
-    async_add_entities(entities, False)
+    # Load connectivity config for all devices concurrently, so the initial
+    # state is written when the entities are added
+    await asyncio.gather(
+        *(entity._load_connectivity_config() for entity in entities),
+        return_exceptions=True,
+    )
     
-    _LOGGER.info("Added %d sensors (IP + Connectivity)", len(entities))
-
-
-class ShellyIPSensor(SensorEntity):
-    """Sensor showing Shelly device IP address."""
+    async_add_entities(entities, False)
     
-    def __init__(self, hass: HomeAssistant, device_info: dict) -> None:
-        """Initialize the sensor."""
-        self.hass = hass
-        self._device = device_info["device"]
-        self._host = device_info["host"]
-        self._entry = device_info["entry"]
-        
-        # Entity setup
-        self._attr_has_entity_name = True
-        self._attr_unique_id = f"{self._device.id}_ip_address"
-        self._attr_name = "IP Address"
-        self._attr_icon = "mdi:ip-network"
-        
-        # Link to Shelly device
-        self._attr_device_info = {
-            "identifiers": self._device.identifiers,
-        }
-        
-        # State
-        self._attr_native_value = self._host
-        self._attr_available = True
+    _LOGGER.info("Added %d sensors (Connectivity)", len(entities))
 
 
 class ShellyConnectivitySensor(SensorEntity):
-    """Sensor showing Shelly connectivity config (CoIoT for Gen1, WebSocket for Gen2/3)."""
+    """Sensor showing Shelly connectivity config (CoIoT for Gen1, WebSocket for Gen2/3).
+    
+    The device IP address is exposed as the ip_address attribute.
+    """
     
-    def __init__(self, hass: HomeAssistant, device_info: dict) -> None:
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        device_info: dict,
+        entry_data: dict,
+    ) -> None:
         """Initialize the sensor."""
         self.hass = hass
+        self._entry_data = entry_data
         self._device = device_info["device"]
         self._host = device_info["host"]
         self._entry = device_info["entry"]
+        self._gen = device_info.get("gen")
+        self._coordinator = device_info.get("coordinator")
+        
+        # Credentials from Shelly integration config
+        self._auth = basic_auth(
+            self._entry.data.get("username", ""),
+            self._entry.data.get("password", ""),
+        )
         
         # Entity setup
         self._attr_has_entity_name = True
@@ -98,36 +89,35 @@ class ShellyConnectivitySensor(SensorEntity):
         self._attr_icon = "mdi:lan-connect"
         
         # Link to Shelly device
-        self._attr_device_info = {
-            "identifiers": self._device.identifiers,
-        }
+        self._attr_device_info = device_info["attr_device_info"]
         
-        # State - will be loaded
+        # State - preloaded in async_setup_entry
         self._attr_native_value = None
         self._attr_available = True
-    
-    async def async_added_to_hass(self) -> None:
-        """Load connectivity config when added."""
-        await self._load_connectivity_config()
-        self.async_write_ha_state()
+        self._attr_extra_state_attributes = {"ip_address": self._host}
     
     async def _load_connectivity_config(self) -> None:
         """Load connectivity config based on device generation."""
-        # Get credentials from Shelly integration config
-        username = self._entry.data.get("username", "")
-        password = self._entry.data.get("password", "")
-        
         try:
-            async with aiohttp.ClientSession() as session:
-                # Detect generation first
-                gen = await self._detect_generation(session)
-                
-                if gen >= 2:
-                    # Gen2/3: Get outbound WebSocket
-                    await self._load_gen2_websocket(session, username, password)
+            gen = await get_gen(
+                self.hass, self._entry_data, self._host, known=self._gen
+            )
+            
+            # Prefer config already held by the Shelly coordinator
+            if gen >= 2:
+                # Gen2/3: Get outbound WebSocket
+                ws_config = self._coordinator_config("config", "ws")
+                if ws_config is not None:
+                    self._set_gen2_websocket(ws_config)
+                else:
+                    await self._load_gen2_websocket()
+            else:
+                # Gen1: Get CoIoT peer
+                coiot = self._coordinator_config("settings", "coiot")
+                if coiot is not None:
+                    self._set_gen1_coiot(coiot)
                 else:
-                    # Gen1: Get CoIoT peer
-                    await self._load_gen1_coiot(session, username, password)
+                    await self._load_gen1_coiot()
         
         except Exception as err:
             _LOGGER.debug(
@@ -137,90 +127,59 @@ class ShellyConnectivitySensor(SensorEntity):
             )
             self._attr_native_value = "Unknown"
     
-    async def _detect_generation(self, session) -> int:
-        """Detect device generation."""
+    def _coordinator_config(self, attr: str, key: str) -> dict | None:
+        """Get a config block from the Shelly coordinator's device, if loaded.
+        
+        Gen2/3 (RPC) devices keep their config in device.config, Gen1 (block)
+        devices in device.settings.
+        """
+        if self._coordinator is None:
+            return None
+        
         try:
-            url = f"http://{self._host}/shelly"
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=3)) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return data.get("gen", 1)
-        except:
-            pass
-        return 1
+            config = getattr(self._coordinator.device, attr)
+        except (AttributeError, ShellyError):
+            # Device not initialized yet
+            return None
+        
+        if isinstance(config, dict):
+            return config.get(key)
+        return None
     
-    async def _load_gen1_coiot(self, session, username: str, password: str) -> None:
+    async def _load_gen1_coiot(self) -> None:
         """Load CoIoT peer for Gen1 devices."""
         url = f"http://{self._host}/settings"
         
-        # Setup auth if available
-        auth = None
-        if password and username:
-            auth = aiohttp.BasicAuth(login=username, password=password)
-        
-        async with session.get(
+        status, data = await request_json(
+            self._entry_data,
             url,
-            auth=auth,
-            timeout=aiohttp.ClientTimeout(total=5)
-        ) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                coiot = data.get("coiot", {})
-                peer = coiot.get("peer", "")
-                
-                if not peer or peer == "":
-                    self._attr_native_value = "CoIoT: mcast (multicast)"
-                else:
-                    self._attr_native_value = f"CoIoT: unicast {peer}"
-                
-                _LOGGER.debug(
-                    "Gen1 CoIoT for '%s': %s",
-                    self._device.name,
-                    self._attr_native_value,
-                )
-            elif resp.status == 401:
-                self._attr_native_value = "CoIoT: Unknown (auth required)"
+            auth=self._auth,
+            timeout=TIMEOUT_DEFAULT,
+        )
+        if status == 200:
+            self._set_gen1_coiot(data.get("coiot", {}))
+        elif status == 401:
+            self._attr_native_value = "CoIoT: Unknown (auth required)"
     
-    async def _load_gen2_websocket(self, session, username: str, password: str) -> None:
+    async def _load_gen2_websocket(self) -> None:
         """Load outbound WebSocket for Gen2/3 devices."""
         url = f"http://{self._host}/rpc/Sys.GetConfig"
         
-        # Setup auth if available
-        auth = None
-        if password and username:
-            auth = aiohttp.BasicAuth(login=username, password=password)
-        
         try:
-            async with session.post(
+            status, data = await request_json(
+                self._entry_data,
                 url,
+                method="POST",
                 json={},
-                auth=auth,
-                timeout=aiohttp.ClientTimeout(total=5)
-            ) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    
-                    # Try to get WebSocket server config
-                    ws_config = data.get("ws", {})
-                    ws_server = ws_config.get("server", "")
-                    
-                    if ws_server:
-                        self._attr_native_value = f"WebSocket: {ws_server}"
-                        _LOGGER.debug(
-                            "Gen2/3 WebSocket for '%s': %s",
-                            self._device.name,
-                            ws_server,
-                        )
-                    else:
-                        # No explicit WebSocket configured - this is normal
-                        self._attr_native_value = "WebSocket: Not configured (uses mDNS)"
-                        _LOGGER.debug(
-                            "Gen2/3 WebSocket for '%s': Not explicitly configured",
-                            self._device.name,
-                        )
-                
-                elif resp.status == 401:
-                    self._attr_native_value = "WebSocket: Unknown (auth required)"
+                auth=self._auth,
+                timeout=TIMEOUT_DEFAULT,
+            )
+            if status == 200:
+                # Try to get WebSocket server config
+                self._set_gen2_websocket(data.get("ws", {}))
+            
+            elif status == 401:
+                self._attr_native_value = "WebSocket: Unknown (auth required)"
         
         except Exception as err:
             _LOGGER.debug(
@@ -230,3 +189,36 @@ class ShellyConnectivitySensor(SensorEntity):
             )
             # Default for Gen2/3 without explicit config
             self._attr_native_value = "WebSocket: Auto-discovery (mDNS)"
+    
+    def _set_gen1_coiot(self, coiot: dict) -> None:
+        """Set state from a Gen1 CoIoT config block."""
+        peer = coiot.get("peer", "")
+        
+        if not peer or peer == "":
+            self._attr_native_value = "CoIoT: mcast (multicast)"
+        else:
+            self._attr_native_value = f"CoIoT: unicast {peer}"
+        
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug(
+                "Gen1 CoIoT for '%s': %s",
+                self._device.name,
+                self._attr_native_value,
+            )
+    
+    def _set_gen2_websocket(self, ws_config: dict) -> None:
+        """Set state from a Gen2/3 WebSocket config block."""
+        ws_server = ws_config.get("server", "")
+        
+        if ws_server:
+            self._attr_native_value = f"WebSocket: {ws_server}"
+        else:
+            # No explicit WebSocket configured - this is normal
+            self._attr_native_value = "WebSocket: Not configured (uses mDNS)"
+        
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug(
+                "Gen2/3 WebSocket for '%s': %s",
+                self._device.name,
+                ws_server or "Not explicitly configured",
+            )